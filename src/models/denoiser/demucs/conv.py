@@ -0,0 +1,214 @@
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+################################################################################
+# Convolutional layers for DEMUCS architecture
+################################################################################
+
+
+class ConvGLU1d(nn.Conv1d):
+    """
+    Channel-expanding 1D convolution followed by a gated linear unit over the
+    channel dimension, computed as a single module so that the gating can be
+    fused into the convolution epilogue when compiled. Holds a weight of shape
+    (2 * out_channels, in_channels // groups, kernel_size), allowing weights of
+    an equivalent `nn.Conv1d` to be loaded directly. For grouped convolutions,
+    each group computes both the values and gates of its own output channels.
+    """
+    def __init__(self,
+                 in_channels: int,
+                 out_channels: int,
+                 kernel_size: int,
+                 stride: int = 1,
+                 padding: int = 0,
+                 groups: int = 1,
+                 bias: bool = True):
+        """
+        :param in_channels: input channel dimension
+        :param out_channels: output channel dimension, after gating
+        :param kernel_size: convolutional kernel size
+        :param stride: convolutional stride
+        :param padding: convolutional padding
+        :param groups: number of blocked connections from input to output
+                       channels
+        :param bias: if True, use bias
+        """
+        super().__init__(
+            in_channels,
+            2 * out_channels,
+            kernel_size,
+            stride=stride,
+            padding=padding,
+            groups=groups,
+            bias=bias
+        )
+
+    @torch.no_grad()
+    def to_dense(self):
+        """
+        Return an equivalent ungrouped layer, whose first and second halves of
+        convolutional output channels hold values and gates respectively.
+        """
+        if self.groups == 1:
+            return self
+
+        out_channels = self.out_channels // 2
+        group_in = self.in_channels // self.groups
+        group_out = out_channels // self.groups
+
+        dense = ConvGLU1d(
+            self.in_channels,
+            out_channels,
+            self.kernel_size[0],
+            stride=self.stride[0],
+            padding=self.padding[0],
+            bias=self.bias is not None
+        ).to(self.weight)
+
+        # grouped output channels are ordered (group, value/gate, channel)
+        weight = self.weight.reshape(
+            self.groups, 2, group_out, group_in, -1
+        )
+        dense.weight.zero_()
+        for g in range(self.groups):
+            for half in range(2):
+                start = half * out_channels + g * group_out
+                dense.weight[
+                    start:start + group_out,
+                    g * group_in:(g + 1) * group_in
+                ] = weight[g, half]
+
+        if self.bias is not None:
+            dense.bias.copy_(
+                self.bias.reshape(self.groups, 2, group_out)
+                .transpose(0, 1).reshape(-1)
+            )
+
+        return dense
+
+    def forward(self, x: torch.Tensor):
+        """
+        Parameters
+        ----------
+        x (Tensor): shape (n_batch, in_channels, n_frames)
+
+        Returns
+        -------
+        out (Tensor): shape (n_batch, out_channels, n_frames_out)
+        """
+        out = self._conv_forward(x, self.weight, self.bias)
+
+        if self.groups > 1:
+            n_batch, _, n_frames = out.shape
+            values, gates = out.reshape(
+                n_batch, self.groups, 2, -1, n_frames
+            ).unbind(dim=2)
+            return (values * torch.sigmoid(gates)).reshape(
+                n_batch, -1, n_frames
+            )
+
+        return F.glu(out, dim=1)
+
+
+class SegregatedConvTranspose1d(nn.ConvTranspose1d):
+    """
+    Strided transposed 1D convolution computed as `stride` sub-kernel
+    convolutions, one per output phase, whose outputs are interleaved. This
+    avoids the multiplications against zeros implicitly inserted between input
+    samples by a transposed convolution. Parameters, initialization, and state
+    dict layout are those of the equivalent unpadded `nn.ConvTranspose1d`;
+    sub-kernels are sliced from the transposed weight on each forward pass.
+    """
+    def __init__(self,
+                 in_channels: int,
+                 out_channels: int,
+                 kernel_size: int,
+                 stride: int,
+                 bias: bool = True):
+        """
+        :param in_channels: input channel dimension
+        :param out_channels: output channel dimension
+        :param kernel_size: kernel size of equivalent transposed convolution;
+                            must be divisible by stride
+        :param stride: upsampling stride of equivalent transposed convolution
+        :param bias: if True, use bias
+        """
+
+        assert kernel_size % stride == 0, \
+            f'Kernel size {kernel_size} must be divisible by stride {stride}'
+
+        super().__init__(
+            in_channels,
+            out_channels,
+            kernel_size,
+            stride=stride,
+            bias=bias
+        )
+
+    @classmethod
+    def from_conv_transpose(cls, conv: nn.ConvTranspose1d):
+        """
+        Construct from a (trained) transposed convolution.
+        """
+        assert conv.padding == (0,) and conv.output_padding == (0,) \
+            and conv.dilation == (1,) and conv.groups == 1, \
+            'Only unpadded, undilated, ungrouped convolutions are supported'
+
+        segregated = cls(
+            conv.in_channels,
+            conv.out_channels,
+            conv.kernel_size[0],
+            conv.stride[0],
+            bias=conv.bias is not None
+        )
+        segregated.load_state_dict(conv.state_dict())
+
+        return segregated.to(conv.weight)
+
+    def _sub_kernels(self):
+        """
+        Convert transposed convolution kernel of shape
+        (in_channels, out_channels, kernel_size) to stacked, time-reversed
+        sub-kernels of shape (stride * out_channels, in_channels, kernel_size
+        // stride), where sub-kernel `p` holds taps `p::stride`.
+        """
+        in_channels, out_channels = self.in_channels, self.out_channels
+        kernel_size, stride = self.kernel_size[0], self.stride[0]
+
+        weight = self.weight.reshape(
+            in_channels, out_channels, kernel_size // stride, stride
+        ).permute(3, 1, 0, 2)  # (stride, out_channels, in_channels, taps)
+
+        return weight.flip(-1).reshape(
+            stride * out_channels, in_channels, kernel_size // stride
+        )
+
+    def forward(self, x: torch.Tensor):
+        """
+        Parameters
+        ----------
+        x (Tensor): shape (n_batch, in_channels, n_frames)
+
+        Returns
+        -------
+        out (Tensor): shape (n_batch, out_channels, (n_frames - 1) * stride
+                      + kernel_size)
+        """
+        n_batch = x.shape[0]
+        stride = self.stride[0]
+        taps = self.kernel_size[0] // stride
+
+        bias = None if self.bias is None else self.bias.repeat(stride)
+
+        # (n_batch, stride * out_channels, n_frames + taps - 1); arguments are
+        # passed positionally so that the convolution can be lowered to a
+        # quantized kernel by FX graph mode quantization
+        out = F.conv1d(x, self._sub_kernels(), bias, 1, taps - 1, 1, 1)
+
+        # interleave phases along time axis
+        out = out.reshape(
+            n_batch, stride, self.out_channels, -1
+        ).permute(0, 2, 3, 1)
+
+        return out.reshape(n_batch, self.out_channels, -1)
@@ -2,15 +2,70 @@ import torch
 import torch.nn as nn
 import torch.nn.functional as F
 
+import contextlib
+import copy
+import functools
 import math
+import warnings
 
-from src.models.denoiser.demucs.resample import upsample2, downsample2
+from typing import Iterable
+
+from src.models.denoiser.demucs.resample import (
+    upsample2, downsample2, kernel_upsample2, kernel_downsample2
+)
+from src.models.denoiser.demucs.conv import (
+    ConvGLU1d, SegregatedConvTranspose1d
+)
+from src.models.denoiser.demucs.lstm import LinearLSTM
+from src.models.denoiser.demucs.linear import BlockDiagonalLinear
 
 ################################################################################
 # DEMUCS U-Net denoiser architecture
 ################################################################################
 
 
+@functools.lru_cache(maxsize=1024)
+def _valid_length(length: int,
+                  depth: int,
+                  kernel_conv: int,
+                  stride_conv: int,
+                  kernel_glu: int,
+                  stride_glu: int,
+                  resample: int):
+    """
+    Compute nearest valid input length for given architecture parameters (see
+    `Demucs.valid_length`). Memoized, as this is called on every forward pass.
+    """
+
+    # compute length through input resampling operation
+    length = math.ceil(length * resample)
+
+    # compute output length through each encoder layer
+    for idx in range(depth):
+        length = math.ceil((length - kernel_conv) / stride_conv) + 1
+        length = max(length, 1)
+        length = math.ceil((length - kernel_glu) / stride_glu) + 1
+        length = max(length, 1)
+
+    # compute output length through each decoder layer, assuming constant
+    # convolutional kernel
+    for idx in range(depth):
+        length = (length - 1) * stride_conv + kernel_conv
+
+    # compute length through output downsampling operation
+    length = int(math.ceil(length / resample))
+    return int(length)
+
+
+def _is_compiling():
+    """
+    Return True if called while tracing with `torch.compile`; always False on
+    PyTorch versions without `torch.compiler`.
+    """
+    compiler = getattr(torch, 'compiler', None)
+    return compiler is not None and compiler.is_compiling()
+
+
 class Demucs(nn.Module):
 
     def __init__(self,
@@ -24,9 +79,15 @@ class Demucs(nn.Module):
                  kernel_conv: int = 8,
                  stride_glu: int = 1,
                  kernel_glu: int = 1,
+                 groups_glu: int = 1,
                  original: bool = True,
                  use_bias: bool = True,
-                 normalize: bool = True
+                 normalize: bool = True,
+                 fused_lstm: bool = False,
+                 grouped_linear: bool = False,
+                 compile_model: bool = False,
+                 compile_mode: str = 'reduce-overhead',
+                 precision: str = 'fp32'
                  ):
         """
         Construct Demucs-like waveform convolutional denoiser architecture.
@@ -42,9 +103,30 @@ class Demucs(nn.Module):
         :param kernel_conv: kernel size of convolutional layers
         :param stride_glu: stride of channel-expanding pre-GLU convolutional layers
         :param kernel_glu: kernel size of channel-expanding pre-GLU convolutional layers
+        :param groups_glu: number of groups in channel-expanding pre-GLU
+                           convolutional layers
         :param original: if True, use ReLU activation on initial convolutional layer
         :param use_bias: if True, use bias in all convolutional layers
         :param normalize: if True, normalize input audio
+        :param fused_lstm: if True, replace cuDNN LSTM bottleneck with an
+                           equivalent LSTM built from linear layers and a
+                           scripted cell, which `torch.compile` can fuse with
+                           surrounding operations
+        :param grouped_linear: if True and not causal, compute each half of the
+                               bottleneck output projection from a single LSTM
+                               direction using a block-diagonal linear layer
+        :param compile_model: if True, compile forward pass with `torch.compile`;
+                              the time axis is compiled as dynamic to avoid
+                              recompilation on every new input length
+        :param compile_mode: `torch.compile` mode; the default
+                             'reduce-overhead' captures and replays CUDA graphs
+        :param precision: must be one of 'fp32', 'bf16-mixed', or 'fp8-mixed'.
+                          If 'bf16-mixed', run encoder, bottleneck, and
+                          decoder under bfloat16 autocast while keeping input
+                          normalization, resampling, and output scaling in
+                          full precision. If 'fp8-mixed', additionally compute
+                          bottleneck projections in FP8 (see
+                          `_convert_bottleneck_fp8`)
         """
 
         super().__init__()
@@ -54,6 +136,7 @@ class Demucs(nn.Module):
         self.causal = causal
         self.normalize = normalize
         self.resample = resample
+        self.precision = precision
 
         # store for receptive field & valid length computations
         self.depth = depth
@@ -63,6 +146,16 @@ class Demucs(nn.Module):
         self.kernel_glu = kernel_glu
 
         assert resample in [1, 2, 4], "Resampling factor must be 1, 2 or 4."
+        assert precision in ['fp32', 'bf16-mixed', 'fp8-mixed'], \
+            f'Invalid precision {precision}'
+
+        # precompute sinc resampling kernels; excluded from state dict
+        self.register_buffer(
+            '_upsample_kernel', kernel_upsample2(), persistent=False
+        )
+        self.register_buffer(
+            '_downsample_kernel', kernel_downsample2(), persistent=False
+        )
 
         # construct waveform convolutional encoder and decoder
         encoder_blocks = []
@@ -78,6 +171,7 @@ class Demucs(nn.Module):
                     kernel_conv=kernel_conv,
                     stride_glu=stride_glu,
                     kernel_glu=kernel_glu,
+                    groups_glu=groups_glu,
                     use_relu=original or i,
                     use_bias=use_bias
                 )
@@ -91,6 +185,7 @@ class Demucs(nn.Module):
                     kernel_conv=kernel_conv,
                     stride_glu=stride_glu,
                     kernel_glu=kernel_glu,
+                    groups_glu=groups_glu,
                     use_relu=depth - i - 1 > 0,  # omit activation from final decoder layer
                     use_bias=use_bias
                 )
@@ -105,16 +200,33 @@ class Demucs(nn.Module):
 
         # construct recurrent latent bottleneck
         encoder_channels = int(growth * hidden_dim * (2 ** (depth - 1)))
-        self.rnn = nn.LSTM(
-            input_size=encoder_channels,
-            hidden_size=encoder_channels,
-            num_layers=2,
-            bidirectional=not causal,
-            bias=use_bias
-        )
+        if fused_lstm:
+            self.rnn = LinearLSTM(
+                input_size=encoder_channels,
+                hidden_size=encoder_channels,
+                num_layers=2,
+                bidirectional=not causal,
+                bias=use_bias
+            )
+        else:
+            self.rnn = nn.LSTM(
+                input_size=encoder_channels,
+                hidden_size=encoder_channels,
+                num_layers=2,
+                batch_first=True,
+                bidirectional=not causal,
+                bias=use_bias
+            )
 
         # only apply linear projection for non-causal bidirectional LSTM
-        if not causal:
+        if not causal and grouped_linear:
+            self.linear = BlockDiagonalLinear(
+                2*encoder_channels,
+                encoder_channels,
+                n_blocks=2,
+                bias=use_bias
+            )
+        elif not causal:
             self.linear = nn.Linear(
                 2*encoder_channels,
                 encoder_channels,
@@ -123,19 +235,390 @@ class Demucs(nn.Module):
         else:
             self.linear = nn.Identity()
 
+        # optionally, compile forward pass. The unbound implementation is
+        # compiled so that copies of this module do not share a bound method
+        self.compile_model = compile_model and hasattr(torch, 'compile')
+        if compile_model and not self.compile_model:
+            warnings.warn('Warning: `torch.compile` unavailable in installed '
+                          'PyTorch version; running in eager mode')
+
+        if self.compile_model:
+            self._compiled_forward = torch.compile(
+                Demucs._forward_impl,
+                mode=compile_mode,
+                fullgraph=False
+            )
+
+            # the memory-bound preprocessing steps are compiled separately to
+            # fuse them into a small number of kernels
+            self._compiled_preprocess = torch.compile(
+                Demucs._normalize_and_upsample
+            )
+        else:
+            self._compiled_forward = None
+            self._compiled_preprocess = None
+
+        # optionally, compute bottleneck projections in FP8
+        if precision == 'fp8-mixed':
+            self._convert_bottleneck_fp8()
+
+        # pack LSTM weights once rather than on every forward pass
+        if isinstance(self.rnn, nn.RNNBase):
+            self.rnn.flatten_parameters()
+
+    def _apply(self, *args, **kwargs):
+        """
+        Re-pack LSTM weights into a single contiguous buffer whenever
+        parameters are moved or cast (e.g. via `.to()` or `.cuda()`).
+        """
+        module = super()._apply(*args, **kwargs)
+        if isinstance(self.rnn, nn.RNNBase):
+            self.rnn.flatten_parameters()
+        return module
+
+    @torch.no_grad()
     def _rescale_conv(self, reference: float):
         """
         Rescale all convolutional and transpose-convolutional weights
         and biases to reference scale.
         """
-        for module in self.modules():
-            if isinstance(module, (nn.Conv1d, nn.ConvTranspose1d)):
+        convs = [
+            module for module in self.modules()
+            if isinstance(module, (nn.Conv1d, nn.ConvTranspose1d))
+        ]
+
+        # group weights of identical shape to compute standard deviations in
+        # a single reduction per group
+        groups = {}
+        for i, module in enumerate(convs):
+            groups.setdefault(module.weight.shape, []).append(i)
+
+        # compute all scales up front, then divide in batched operations
+        scales = [None] * len(convs)
+        for idx in groups.values():
+            if len(idx) > 1:
+                stds = torch.stack(
+                    [convs[i].weight for i in idx]
+                ).flatten(1).std(dim=1)
+            else:
+                stds = convs[idx[0]].weight.std().view(1)
+            for i, scale in zip(idx, ((stds / reference)**0.5).tolist()):
+                scales[i] = scale
+        torch._foreach_div_([module.weight for module in convs], scales)
+
+        biases, bias_scales = [], []
+        for module, scale in zip(convs, scales):
+            if module.bias is not None:
+                biases.append(module.bias)
+                bias_scales.append(scale)
+
+        if biases:
+            torch._foreach_div_(biases, bias_scales)
+
+    def _convert_bottleneck_fp8(self):
+        """
+        Rewrite the recurrent bottleneck using linear gate projections and
+        convert these, along with the linear projection, to FP8 training with
+        dynamic tensorwise scaling via TorchAO. Requires a GPU with compute
+        capability of at least 9.0 (Hopper); otherwise, falls back to
+        'bf16-mixed' precision. FP8 layers only yield speedups when compiled.
+        """
+
+        try:
+            from torchao.float8 import (
+                convert_to_float8_training, Float8LinearConfig
+            )
+        except ImportError:
+            warnings.warn('Warning: FP8 precision requires `torchao`; '
+                          'falling back to bf16-mixed precision')
+            self.precision = 'bf16-mixed'
+            return
+
+        if not torch.cuda.is_available() or \
+                torch.cuda.get_device_capability() < (9, 0):
+            warnings.warn('Warning: FP8 precision requires a GPU with compute '
+                          'capability of at least 9.0; falling back to '
+                          'bf16-mixed precision')
+            self.precision = 'bf16-mixed'
+            return
+
+        if not self.compile_model:
+            warnings.warn('Warning: FP8 precision without `compile_model` is '
+                          'unlikely to improve throughput')
+
+        config = Float8LinearConfig.from_recipe_name('tensorwise')
+
+        if not isinstance(self.rnn, LinearLSTM):
+            self.rnn = LinearLSTM.from_lstm(self.rnn)
+
+        self.rnn = convert_to_float8_training(self.rnn, config=config)
+        if isinstance(self.linear, nn.Linear):
+            self.linear = convert_to_float8_training(self.linear, config=config)
 
-                std = module.weight.std().detach()
-                scale = (std / reference)**0.5
-                module.weight.data /= scale
-                if module.bias is not None:
-                    module.bias.data /= scale
+    @torch.no_grad()
+    def fold_glu(self):
+        """
+        For inference, fold pointwise pre-GLU convolutions into the preceding
+        encoder convolutions wherever no activation separates the two (e.g.
+        the first encoder block when `original=False`), replacing each pair
+        with a single channel-expanding convolution. Modifies the model in
+        place; the resulting state dict is not compatible with unfolded models.
+        """
+        for i, block in enumerate(self.encoder):
+
+            if not isinstance(block, nn.Sequential) or len(block) != 3:
+                continue
+
+            conv, relu, conv_glu = block
+            if not isinstance(relu, nn.Identity) or \
+                    not isinstance(conv_glu, ConvGLU1d) or \
+                    conv_glu.kernel_size != (1,) or conv_glu.stride != (1,):
+                continue
+
+            conv_glu = conv_glu.to_dense()
+            w_glu = conv_glu.weight.squeeze(-1)  # (2 * out_channels, channels)
+
+            fused = ConvGLU1d(
+                conv.in_channels,
+                conv_glu.out_channels // 2,
+                conv.kernel_size[0],
+                stride=conv.stride[0],
+                padding=conv.padding[0],
+                bias=conv.bias is not None or conv_glu.bias is not None
+            ).to(conv.weight)
+
+            fused.weight.copy_(torch.einsum('oc,cik->oik', w_glu, conv.weight))
+
+            if fused.bias is not None:
+                fused.bias.zero_()
+                if conv.bias is not None:
+                    fused.bias.add_(w_glu @ conv.bias)
+                if conv_glu.bias is not None:
+                    fused.bias.add_(conv_glu.bias)
+
+            self.encoder[i] = nn.Sequential(fused)
+
+    @torch.no_grad()
+    def quantize(self,
+                 calib_loader: Iterable,
+                 mode: str = 'mixfp16_int8',
+                 backend: str = 'fbgemm'):
+        """
+        Return a post-training quantized copy of the model for CPU inference.
+        Encoder and decoder convolutions are statically quantized to INT8 using
+        activation ranges observed over calibration audio, while the recurrent
+        bottleneck and linear projection are dynamically quantized. All other
+        operations (activations, gating, skip connections, input normalization,
+        resampling, and output scaling) remain in floating point, as do the
+        first encoder and last decoder blocks, which operate directly on
+        waveforms.
+
+        :param calib_loader: iterable over calibration audio batches, given
+                             either as tensors, tuples whose first element is
+                             audio, or dictionaries with audio under key `x`
+        :param mode: must be one of 'mixfp16_int8' (FP16 bottleneck) or 'int8'
+                     (INT8 bottleneck)
+        :param backend: quantized engine, e.g. 'fbgemm' (x86) or 'qnnpack'
+                        (ARM); set globally, as quantized kernels are
+                        dispatched according to the active engine. The
+                        'qnnpack' engine supports only 'int8' mode
+        :return: quantized model
+        """
+
+        # imported locally, as quantization APIs differ across PyTorch versions
+        from torch.ao.quantization import (
+            QConfigMapping,
+            get_default_qconfig,
+            float16_dynamic_qconfig,
+            default_dynamic_qconfig,
+            quantize_dynamic
+        )
+        from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+        assert mode in ['mixfp16_int8', 'int8'], \
+            f'Invalid quantization mode {mode}'
+        assert not (backend == 'qnnpack' and mode == 'mixfp16_int8'), \
+            'QNNPACK does not support FP16 dynamic quantization; use mode ' \
+            '\'int8\''
+
+        torch.backends.quantized.engine = backend
+
+        model = copy.deepcopy(self).cpu().eval()
+        model.precision = 'fp32'
+        model.compile_model = False
+        model._compiled_forward = None
+        model._compiled_preprocess = None
+
+        # quantize only convolutions, including those computed functionally
+        # within `ConvGLU1d` and `SegregatedConvTranspose1d`; quantization and
+        # dequantization steps are placed around each convolution. Encoder
+        # ReLU activations are fused into the preceding convolutions, and so
+        # must share their configuration
+        qconfig = get_default_qconfig(backend)
+        decoder_mapping = QConfigMapping()
+        encoder_mapping = QConfigMapping()
+        for object_type in [nn.Conv1d, F.conv1d]:
+            decoder_mapping.set_object_type(object_type, qconfig)
+            encoder_mapping.set_object_type(object_type, qconfig)
+        encoder_mapping.set_object_type(nn.ReLU, qconfig)
+
+        # insert observers into each encoder and decoder block, except those
+        # adjacent to the waveform input and output
+        quantized_blocks = [
+            (model.encoder, range(1, len(model.encoder)), encoder_mapping),
+            (model.decoder, range(len(model.decoder) - 1), decoder_mapping)
+        ]
+        for blocks, idx, qconfig_mapping in quantized_blocks:
+            for i in idx:
+                block = blocks[i]
+                example_inputs = (
+                    torch.zeros(
+                        1,
+                        block[0].in_channels,
+                        self.kernel_conv * self.stride_conv
+                    ),
+                )
+                blocks[i] = prepare_fx(block, qconfig_mapping, example_inputs)
+
+        # calibrate activation ranges
+        for batch in calib_loader:
+            if isinstance(batch, tuple):
+                x = batch[0]
+            elif isinstance(batch, dict):
+                x = batch['x']
+            else:
+                x = batch
+            model(x.cpu())
+
+        for blocks, idx, _ in quantized_blocks:
+            for i in idx:
+                blocks[i] = convert_fx(blocks[i])
+
+        # quantize recurrent bottleneck weights, computing activations in
+        # floating point; quantized LSTM layers require bias terms
+        qconfig = float16_dynamic_qconfig if mode == 'mixfp16_int8' \
+            else default_dynamic_qconfig
+        qconfig_spec = {'linear': qconfig}
+        if getattr(model.rnn, 'bias', False):
+            qconfig_spec['rnn'] = qconfig
+        quantize_dynamic(model, qconfig_spec=qconfig_spec, inplace=True)
+
+        return model
+
+    def _export_copy(self, example_input: torch.Tensor):
+        """
+        Return an eager, full-precision copy of the model in evaluation mode
+        on the device of the given input, suitable for tracing.
+        """
+        model = copy.deepcopy(self).to(example_input.device).eval()
+        model.precision = 'fp32'
+        model.compile_model = False
+        model._compiled_forward = None
+        model._compiled_preprocess = None
+
+        return model
+
+    @torch.no_grad()
+    def export_onnx(self,
+                    dummy_input: torch.Tensor,
+                    path: str,
+                    opset_version: int = 17):
+        """
+        Export the model to ONNX for deployment, e.g. by building a TensorRT
+        engine from the exported graph. The batch dimension is dynamic, but as
+        input padding and valid lengths are computed from Python integers, the
+        signal length is fixed to that of the dummy input; inputs should be
+        padded or chunked to this length at inference time.
+
+        :param dummy_input: example input audio, shape (n_batch, n_channels,
+                            signal_length)
+        :param path: path to exported ONNX file
+        :param opset_version: ONNX operator set version
+        """
+
+        assert dummy_input.ndim == 3, \
+            'Dummy input must have shape (n_batch, n_channels, signal_length)'
+
+        model = self._export_copy(dummy_input)
+
+        torch.onnx.export(
+            model,
+            (dummy_input,),
+            path,
+            opset_version=opset_version,
+            input_names=['input'],
+            output_names=['output'],
+            dynamic_axes={
+                'input': {0: 'n_batch'},
+                'output': {0: 'n_batch'}
+            }
+        )
+
+    @torch.no_grad()
+    def compile_tensorrt(self,
+                         example_input: torch.Tensor,
+                         max_batch_size: int = None,
+                         calib_loader: Iterable = None,
+                         cache_file: str = None):
+        """
+        Return a TensorRT-compiled copy of the model for GPU inference, using
+        FP16 kernels wherever TensorRT selects them and, if calibration audio
+        is provided, INT8 kernels with activation ranges set by TensorRT's
+        entropy calibrator. The model is traced, so as for `export_onnx` only
+        the batch dimension may vary. Requires `torch_tensorrt`.
+
+        :param example_input: example input audio on a CUDA device, shape
+                              (n_batch, n_channels, signal_length); also sets
+                              the optimal batch size for engine tuning
+        :param max_batch_size: maximum batch size; defaults to that of the
+                               example input
+        :param calib_loader: optional `torch.utils.data.DataLoader` over
+                             calibration audio of the example input shape,
+                             enabling INT8 precision
+        :param cache_file: optional path at which to cache INT8 calibration
+        :return: compiled TorchScript module
+        """
+
+        # imported locally, as TensorRT is an optional deployment dependency
+        import torch_tensorrt
+
+        assert example_input.ndim == 3 and example_input.is_cuda, \
+            'Example input must be a CUDA tensor of shape ' \
+            '(n_batch, n_channels, signal_length)'
+
+        n_batch, *shape = example_input.shape
+        max_batch_size = max_batch_size or n_batch
+
+        model = self._export_copy(example_input)
+        traced = torch.jit.trace(model, example_input)
+
+        inputs = [
+            torch_tensorrt.Input(
+                min_shape=(1, *shape),
+                opt_shape=(n_batch, *shape),
+                max_shape=(max_batch_size, *shape)
+            )
+        ]
+
+        enabled_precisions = {torch.float, torch.half}
+        kwargs = {}
+        if calib_loader is not None:
+            enabled_precisions.add(torch.int8)
+            kwargs['calibrator'] = torch_tensorrt.ptq.DataLoaderCalibrator(
+                calib_loader,
+                cache_file=cache_file or './demucs_calibration.cache',
+                use_cache=False,
+                algo_type=torch_tensorrt.ptq.CalibrationAlgo.ENTROPY_CALIBRATION_2,
+                device=example_input.device
+            )
+
+        return torch_tensorrt.compile(
+            traced,
+            ir='ts',
+            inputs=inputs,
+            enabled_precisions=enabled_precisions,
+            **kwargs
+        )
 
     @staticmethod
     def _build_encoder_block(level: int,
@@ -145,6 +628,7 @@ class Demucs(nn.Module):
                              kernel_conv: int,
                              stride_glu: int,
                              kernel_glu: int,
+                             groups_glu: int,
                              use_relu: bool,
                              use_bias: bool) -> nn.Module:
 
@@ -159,17 +643,17 @@ class Demucs(nn.Module):
             bias=use_bias
         )
         relu = nn.ReLU() if use_relu else nn.Identity()
-        conv_glu = nn.Conv1d(
+        conv_glu = ConvGLU1d(
+            out_channels,
             out_channels,
-            2*out_channels,
             kernel_glu,
             stride=stride_glu,
             padding=kernel_glu//2,
+            groups=groups_glu,
             bias=use_bias
         )
-        glu = nn.GLU(dim=1)
 
-        return nn.Sequential(conv, relu, conv_glu, glu)
+        return nn.Sequential(conv, relu, conv_glu)
 
     @staticmethod
     def _build_decoder_block(level: int,
@@ -179,28 +663,44 @@ class Demucs(nn.Module):
                              kernel_conv: int,
                              stride_glu: int,
                              kernel_glu: int,
+                             groups_glu: int,
                              use_relu: bool,
                              use_bias: bool) -> nn.Module:
 
         in_channels = int(hidden_dim * growth * (2 ** level))
         out_channels = 1 if not level else int(hidden_dim * growth * (2**(level - 1)))
 
-        deconv_glu = nn.Conv1d(
+        deconv_glu = ConvGLU1d(
+            in_channels,
             in_channels,
-            2*in_channels,
             kernel_glu,
             stride=stride_glu,
             padding=kernel_glu//2,
+            groups=groups_glu,
             bias=use_bias
         )
-        glu = nn.GLU(dim=1)
-        deconv = nn.ConvTranspose1d(
-            in_channels,
-            out_channels,
-            kernel_conv,
-            stride=stride_conv,
-            bias=use_bias
-        )
+
+        # placeholder preserves layer indices of existing checkpoints
+        glu = nn.Identity()
+
+        # when possible, avoid computation over zeros inserted by strided
+        # transposed convolution
+        if stride_conv > 1 and not kernel_conv % stride_conv:
+            deconv = SegregatedConvTranspose1d(
+                in_channels,
+                out_channels,
+                kernel_conv,
+                stride=stride_conv,
+                bias=use_bias
+            )
+        else:
+            deconv = nn.ConvTranspose1d(
+                in_channels,
+                out_channels,
+                kernel_conv,
+                stride=stride_conv,
+                bias=use_bias
+            )
         relu = nn.ReLU() if use_relu else nn.Identity()
 
         return nn.Sequential(deconv_glu, glu, deconv, relu)
@@ -219,128 +719,450 @@ class Demucs(nn.Module):
         If the input has a valid length, the corresponding decoded signal
         will have exactly the same length.
         """
+        return _valid_length(
+            int(length),
+            self.depth,
+            self.kernel_conv,
+            self.stride_conv,
+            self.kernel_glu,
+            self.stride_glu,
+            self.resample
+        )
 
-        # compute length through input resampling operation
-        length = math.ceil(length * self.resample)
-
-        # compute output length through each encoder layer
-        for idx in range(self.depth):
-            length = math.ceil((length - self.kernel_conv) / self.stride_conv) + 1
-            length = max(length, 1)
-            length = math.ceil((length - self.kernel_glu) / self.stride_glu) + 1
-            length = max(length, 1)
-
-        # compute output length through each decoder layer, assuming constant
-        # convolutional kernel
-        for idx in range(self.depth):
-            length = (length - 1) * self.stride_conv + self.kernel_conv
+    def _autocast(self, x: torch.Tensor):
+        """
+        Return context manager for mixed-precision computation on the device of
+        the given input. When using 'fp32' precision, return a no-op context
+        so that any autocast state set by the caller is left untouched.
+        """
+        if self.precision == 'fp32':
+            return contextlib.nullcontext()
 
-        # compute length through output downsampling operation
-        length = int(math.ceil(length / self.resample))
-        return int(length)
+        return torch.autocast(
+            device_type=x.device.type,
+            dtype=torch.bfloat16,
+            enabled=self.precision != 'fp32'
+        )
 
-    def encode(self, x: torch.Tensor):
+    def _preprocess(self, x: torch.Tensor):
         """
-        Given waveform input, obtain encoder output, discarding intermediate
-        (skip-connection) outputs
+        Convert input to normalized mono audio, zero-pad to a valid length, and
+        upsample. Returns the processed input, the standard deviation for output
+        scaling, and the original input length. Only the padding amount is
+        computed eagerly, as valid lengths are computed from Python integers;
+        when compiling, the remaining steps are fused.
+
+        :param x: input audio, shape (n_batch, [n_channels,] signal_length)
         """
 
         # require batch, channel dimensions
         assert x.ndim >= 2
 
+        # zero-pad end of signal to ensure input and output have same length
+        length = x.shape[-1]
+        pad = self.valid_length(length) - length
+
+        if self._compiled_preprocess is not None:
+            torch._dynamo.maybe_mark_dynamic(x, x.ndim - 1)
+            x, std = self._compiled_preprocess(self, x, pad)
+        else:
+            x, std = self._normalize_and_upsample(x, pad)
+
+        return x, std, length
+
+    def _normalize_and_upsample(self, x: torch.Tensor, pad: int):
+        """
+        Convert input to normalized mono audio, zero-pad end by given number of
+        samples, and upsample. Returns the processed input and the standard
+        deviation for output scaling.
+        """
+
         if x.ndim == 2:
             x = x.unsqueeze(1)
 
         # convert to mono audio
         x = x.mean(dim=1, keepdim=True)
 
-        # normalize
+        # normalize and store standard deviation for output scaling
         if self.normalize:
             std = x.std(dim=-1, keepdim=True)
             x = x / (1e-3 + std)
+        else:
+            std = 1
 
-        # zero-pad end of signal to ensure input and output have same length
-        length = x.shape[-1]
-        x = F.pad(x, (0, self.valid_length(length) - length))
+        x = F.pad(x, (0, pad))
 
         # upsample input waveform
         if self.resample == 2:
-            x = upsample2(x)
+            x = upsample2(x, kernel=self._upsample_kernel)
         elif self.resample == 4:
-            x = upsample2(x)
-            x = upsample2(x)
+            x = upsample2(x, kernel=self._upsample_kernel)
+            x = upsample2(x, kernel=self._upsample_kernel)
+
+        return x, std
+
+    def encode(self, x: torch.Tensor):
+        """
+        Given waveform input, obtain encoder output, discarding intermediate
+        (skip-connection) outputs
+        """
+
+        x, _, _ = self._preprocess(x)
 
         # pass through encoder layers
-        for encode in self.encoder:
-            x = encode(x)
+        dtype = x.dtype
+        with self._autocast(x):
+            for encode in self.encoder:
+                x = encode(x)
+
+        if self.precision != 'fp32':
+            x = x.to(dtype)
 
         return x
 
     def bottleneck(self, encoded: torch.Tensor):
 
-        encoded = encoded.permute(2, 0, 1)  # time, batch, channels
-        self.rnn.flatten_parameters()
+        encoded = encoded.transpose(1, 2).contiguous()  # batch, time, channels
+        out = self._bottleneck(encoded)
+
+        return out.transpose(1, 2)  # batch, channels, time
+
+    def _bottleneck(self, encoded: torch.Tensor):
+        """
+        Apply recurrent bottleneck to contiguous encoder output of shape
+        (n_batch, n_frames, encoder_channels), returning output of the same
+        layout.
+        """
+
+        # replicas created by `nn.DataParallel` bypass `_apply`, so re-pack
+        # LSTM weights here if needed; this is a no-op once weights are packed
+        if isinstance(self.rnn, nn.RNNBase) and not _is_compiling():
+            self.rnn.flatten_parameters()
 
         # per-timestep output, plus final hidden and cell states
         out, (hidden_state, cell_state) = self.rnn(encoded)
-        out = self.linear(out)
-        out = out.permute(1, 2, 0)
 
-        return out
+        return self.linear(out)
 
     def forward(self, x: torch.Tensor, *args, **kwargs):
 
-        # require batch, channel dimensions
-        assert x.ndim >= 2
+        # normalize, pad, and upsample input waveform
+        x, std, length = self._preprocess(x)
 
-        if x.ndim == 2:
-            x = x.unsqueeze(1)
+        if self._compiled_forward is not None:
+            # mark time axis as dynamic so that inputs of new lengths reuse the
+            # compiled graph rather than triggering recompilation
+            torch._dynamo.maybe_mark_dynamic(x, 2)
+            x = self._compiled_forward(self, x)
+        else:
+            x = self._forward_impl(x)
 
-        # convert to mono audio
-        x = x.mean(dim=1, keepdim=True)
+        # trim to original length
+        x = x[..., :length]
 
-        # normalize and store standard deviation for output scaling
-        if self.normalize:
-            std = x.std(dim=-1, keepdim=True)
-            x = x / (1e-3 + std)
-        else:
-            std = 1
+        # restore original scale
+        return std * x
 
-        # zero-pad end of signal to ensure input and output have same length
-        length = x.shape[-1]
-        x = F.pad(x, (0, self.valid_length(length) - length))
+    def _forward_impl(self, x: torch.Tensor):
+        """
+        Given preprocessed input waveform (see `_preprocess`), apply U-Net and
+        downsample.
+        """
 
-        # upsample input waveform
-        if self.resample == 2:
-            x = upsample2(x)
-        elif self.resample == 4:
-            x = upsample2(x)
-            x = upsample2(x)
+        dtype = x.dtype
+        with self._autocast(x):
 
-        # U-Net architecture: store skip connections from encoder outputs
-        skips = []
-        for encode in self.encoder:
-            x = encode(x)
-            skips.append(x)
+            # U-Net architecture: store skip connections from encoder outputs
+            skips = [None] * self.depth
+            for i, encode in enumerate(self.encoder):
+                x = encode(x)
+                skips[i] = x
 
-        # pass through recurrent bottleneck
-        x = self.bottleneck(x)
+            # pass through recurrent bottleneck, changing to channels-last
+            # layout once; the deepest skip connection is a view of the same
+            # buffer, allowing the channels-first encoder output to be freed
+            x = x.transpose(1, 2).contiguous()
+            skips[-1] = x.transpose(1, 2)
+            x = self._bottleneck(x).transpose(1, 2)
 
-        # U-Net architecture: add skip connections to decoder inputs
-        for decode in self.decoder:
-            skip = skips.pop(-1)
-            x = x + skip[..., :x.shape[-1]]
-            x = decode(x)
+            # U-Net architecture: add skip connections to decoder inputs in
+            # reverse order, releasing each once consumed. Without autograd,
+            # decoder inputs are not needed afterwards and are updated in place
+            inplace = not torch.is_grad_enabled()
+            for i, decode in enumerate(self.decoder):
+                skip = skips[self.depth - 1 - i][..., :x.shape[-1]]
+                skips[self.depth - 1 - i] = None
+                x = x.add_(skip) if inplace else x + skip
+                x = decode(x)
+
+        # return to full precision for resampling and output scaling
+        if self.precision != 'fp32':
+            x = x.to(dtype)
 
         # downsample output waveform
         if self.resample == 2:
-            x = downsample2(x)
+            x = downsample2(x, kernel=self._downsample_kernel)
         elif self.resample == 4:
-            x = downsample2(x)
-            x = downsample2(x)
+            x = downsample2(x, kernel=self._downsample_kernel)
+            x = downsample2(x, kernel=self._downsample_kernel)
 
-        # trim to original length
-        x = x[..., :length]
+        return x
 
-        # restore original scale
-        return std * x
+    def _init_streaming_state(self, x: torch.Tensor):
+        """
+        Construct empty streaming state for mono input of shape
+        (n_batch, 1, n_samples). See `forward_streaming`.
+        """
+
+        assert self.causal, 'Streaming requires a causal model'
+        assert self.kernel_glu == 1 and self.stride_glu == 1, \
+            'Streaming requires pointwise pre-GLU convolutions'
+        assert self.stride_conv < self.kernel_conv <= 2 * self.stride_conv, \
+            'Streaming requires convolutional kernels which overlap only ' \
+            'adjacent windows'
+
+        n_batch = x.shape[0]
+
+        # samples kept on either side of each frame to reduce boundary
+        # artifacts when resampling
+        resample_lookahead = 64
+        resample_buffer = min(self.total_stride, 256)
+
+        return {
+            'frame_length': self.valid_length(1),
+            'stride': self.total_stride,
+            'resample_lookahead': resample_lookahead,
+            'resample_buffer': resample_buffer,
+            'resample_in': x.new_zeros(n_batch, 1, resample_buffer),
+            'resample_out': x.new_zeros(n_batch, 1, resample_buffer),
+            'pending': x.new_zeros(n_batch, 1, 0),
+            'frames': 0,
+            'variance': x.new_zeros(n_batch, 1, 1),
+            'lstm': None,
+            'conv': None,
+        }
+
+    @torch.no_grad()
+    def forward_streaming(self, x_chunk: torch.Tensor, state: dict = None):
+        """
+        Denoise audio incrementally, one chunk at a time, carrying recurrent
+        hidden and cell states along with convolution and resampling buffers
+        across calls. Input samples are processed in frames of
+        `valid_length(1)` samples with a hop of `total_stride` samples, so that
+        each frame advances the recurrent bottleneck by a single step and only
+        the newly-covered positions of each encoder and decoder layer are
+        computed. Memory use is therefore independent of the total signal
+        length. Only causal models are supported.
+
+        Outputs lag inputs by a fixed latency; any input not yet covered by a
+        complete frame is held in the returned state until subsequent calls,
+        or until `flush_streaming` is called. As input statistics are not
+        available in advance, normalization uses a running estimate of the
+        signal variance, and outputs therefore differ slightly from `forward`.
+
+        Adapted from https://github.com/facebookresearch/denoiser.
+
+        :param x_chunk: input audio, shape (n_batch, [n_channels,] n_samples)
+        :param state: streaming state returned by previous call; if None,
+                      begin a new stream
+        :return: tuple holding denoised audio of shape (n_batch, 1,
+                 n_samples_out), where `n_samples_out` is a multiple of
+                 `total_stride`, and the updated streaming state. The state
+                 holds recurrent hidden and cell states under key `lstm`
+        """
+
+        # require batch, channel dimensions
+        assert x_chunk.ndim >= 2
+
+        if x_chunk.ndim == 2:
+            x_chunk = x_chunk.unsqueeze(1)
+
+        # convert to mono audio
+        x_chunk = x_chunk.mean(dim=1, keepdim=True)
+
+        if state is None:
+            state = self._init_streaming_state(x_chunk)
+        else:
+            state = dict(state)
+
+        stride = state['stride']
+        frame_length = state['frame_length']
+        total_length = frame_length + state['resample_lookahead']
+        resample_buffer = state['resample_buffer']
+
+        pending = torch.cat([state['pending'], x_chunk], dim=-1)
+
+        outs = []
+        while pending.shape[-1] >= total_length:
+
+            state['frames'] += 1
+            frame = pending[..., :total_length]
+
+            # normalize using running estimate of signal variance
+            if self.normalize:
+                variance = (frame ** 2).mean(dim=-1, keepdim=True)
+                state['variance'] = variance / state['frames'] + \
+                    (1 - 1 / state['frames']) * state['variance']
+                frame = frame / (1e-3 + state['variance'].sqrt())
+
+            # prepend trailing samples of previous frame before upsampling
+            padded_frame = torch.cat([state['resample_in'], frame], dim=-1)
+            state['resample_in'] = frame[
+                ..., stride - resample_buffer:stride
+            ]
+            frame = padded_frame
+
+            if self.resample == 2:
+                frame = upsample2(frame, kernel=self._upsample_kernel)
+            elif self.resample == 4:
+                frame = upsample2(frame, kernel=self._upsample_kernel)
+                frame = upsample2(frame, kernel=self._upsample_kernel)
+
+            # remove resampling buffer and lookahead
+            frame = frame[..., self.resample * resample_buffer:]
+            frame = frame[..., :self.resample * frame_length]
+
+            out, extra = self._forward_frame(frame, state)
+
+            # prepend trailing samples of previous output before downsampling,
+            # and append partial output samples as lookahead
+            padded_out = torch.cat([state['resample_out'], out, extra], dim=-1)
+            state['resample_out'] = out[..., -resample_buffer:]
+
+            if self.resample == 2:
+                out = downsample2(padded_out, kernel=self._downsample_kernel)
+            elif self.resample == 4:
+                out = downsample2(padded_out, kernel=self._downsample_kernel)
+                out = downsample2(out, kernel=self._downsample_kernel)
+            else:
+                out = padded_out
+
+            out = out[..., resample_buffer // self.resample:]
+            out = out[..., :stride]
+
+            # restore original scale
+            if self.normalize:
+                out = out * state['variance'].sqrt()
+
+            outs.append(out)
+            pending = pending[..., stride:]
+
+        state['pending'] = pending
+
+        if outs:
+            out = torch.cat(outs, dim=-1)
+        else:
+            out = x_chunk.new_zeros(x_chunk.shape[0], 1, 0)
+
+        return out, state
+
+    def flush_streaming(self, state: dict):
+        """
+        Pad the end of a stream with silence to obtain outputs for all pending
+        input samples (see `forward_streaming`).
+
+        :param state: streaming state returned by `forward_streaming`
+        :return: denoised audio for pending input samples, shape (n_batch, 1,
+                 n_pending)
+        """
+        pending_length = state['pending'].shape[-1]
+        padding = state['pending'].new_zeros(
+            state['pending'].shape[0],
+            1,
+            state['frame_length'] + state['resample_lookahead']
+        )
+        out, _ = self.forward_streaming(padding, state)
+        return out[..., :pending_length]
+
+    def _forward_frame(self, frame: torch.Tensor, state: dict):
+        """
+        Pass a single upsampled frame through the encoder, bottleneck, and
+        decoder, recomputing only those positions of each layer not covered by
+        the previous frame. Returns the completed output samples along with
+        extra, partially-computed samples to the right, which serve as padding
+        for resampling. Updates the convolution and recurrent states in place.
+        """
+
+        first = state['conv'] is None
+        prev_state = state['conv']
+        next_state = []
+
+        overlap = self.kernel_conv - self.stride_conv
+        stride = state['stride'] * self.resample
+
+        dtype = frame.dtype
+        with self._autocast(frame):
+
+            x = frame
+            skips = [None] * self.depth
+            for i, encode in enumerate(self.encoder):
+
+                stride //= self.stride_conv
+                length = x.shape[-1]
+
+                # reuse outputs of previous frame, discarding those which have
+                # elapsed, and compute only the missing positions
+                if i < self.depth - 1 and not first:
+                    prev = prev_state[i][..., stride:]
+                    target = (length - self.kernel_conv) // self.stride_conv + 1
+                    missing = target - prev.shape[-1]
+                    offset = length - self.kernel_conv - \
+                        self.stride_conv * (missing - 1)
+                    x = torch.cat([prev, encode(x[..., offset:])], dim=-1)
+                else:
+                    x = encode(x)
+
+                if i < self.depth - 1:
+                    next_state.append(x)
+                skips[i] = x
+
+            # advance recurrent bottleneck
+            x, state['lstm'] = self.rnn(
+                x.transpose(1, 2).contiguous(), state['lstm']
+            )
+            x = self.linear(x).transpose(1, 2)
+
+            # `x` holds only positions covered by all overlapping windows of the
+            # transposed convolutions, while `extra` holds partial positions to
+            # the right
+            extra = None
+            for i, decode in enumerate(self.decoder):
+
+                deconv, relu = decode[2], decode[3]
+                skip = skips[self.depth - 1 - i]
+                skips[self.depth - 1 - i] = None
+
+                x = x + skip[..., :x.shape[-1]]
+                x = decode[1](decode[0](x))
+
+                if extra is not None:
+                    skip = skip[..., x.shape[-1]:]
+                    extra = extra + skip[..., :extra.shape[-1]]
+                    extra = deconv(decode[1](decode[0](extra)))
+
+                x = deconv(x)
+
+                # store partial positions, less bias, for the next frame
+                tail = x[..., -overlap:]
+                if deconv.bias is not None:
+                    tail = tail - deconv.bias.view(-1, 1)
+                next_state.append(tail)
+
+                if extra is None:
+                    extra = x[..., -overlap:]
+                else:
+                    extra[..., :overlap] += tail
+
+                x = x[..., :-overlap]
+                if not first:
+                    x[..., :overlap] += prev_state[self.depth - 1 + i]
+
+                x = relu(x)
+                extra = relu(extra)
+
+        state['conv'] = next_state
+
+        if self.precision != 'fp32':
+            x, extra = x.to(dtype), extra.to(dtype)
+
+        return x, extra
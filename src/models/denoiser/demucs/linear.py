@@ -0,0 +1,133 @@
+import math
+import warnings
+
+import torch
+import torch.nn as nn
+
+################################################################################
+# Linear layers for DEMUCS bottleneck
+################################################################################
+
+
+class BlockDiagonalLinear(nn.Module):
+    """
+    Linear layer whose weight matrix is block-diagonal, i.e. input and output
+    features are split into `n_blocks` contiguous blocks and each output block
+    depends only on the corresponding input block. For the projection following
+    a bidirectional LSTM with two blocks, each half of the output is computed
+    from a single direction, halving the FLOPs and weights of a dense layer.
+    """
+    def __init__(self,
+                 in_features: int,
+                 out_features: int,
+                 n_blocks: int = 2,
+                 bias: bool = True):
+        """
+        :param in_features: input feature dimension
+        :param out_features: output feature dimension
+        :param n_blocks: number of diagonal blocks; must divide both input and
+                         output feature dimensions
+        :param bias: if True, use bias
+        """
+        super().__init__()
+
+        assert not in_features % n_blocks and not out_features % n_blocks, \
+            f'Number of blocks {n_blocks} must divide input and output ' \
+            f'dimensions {in_features}, {out_features}'
+
+        self.in_features = in_features
+        self.out_features = out_features
+        self.n_blocks = n_blocks
+
+        self.weight = nn.Parameter(
+            torch.empty(
+                n_blocks, out_features // n_blocks, in_features // n_blocks
+            )
+        )
+        if bias:
+            self.bias = nn.Parameter(torch.empty(out_features))
+        else:
+            self.register_parameter('bias', None)
+
+        self.reset_parameters()
+
+    def reset_parameters(self):
+        """Match initialization of `nn.Linear` for each block"""
+        bound = 1 / math.sqrt(self.in_features // self.n_blocks)
+        nn.init.uniform_(self.weight, -bound, bound)
+        if self.bias is not None:
+            nn.init.uniform_(self.bias, -bound, bound)
+
+    @classmethod
+    def from_linear(cls, linear: nn.Linear, n_blocks: int = 2):
+        """
+        Construct from a (trained) dense linear layer, keeping only its
+        diagonal blocks and discarding all cross-block weights. Outputs will
+        therefore differ from those of the original layer.
+        """
+        block_diagonal = cls(
+            linear.in_features,
+            linear.out_features,
+            n_blocks=n_blocks,
+            bias=linear.bias is not None
+        )
+        state_dict = linear.state_dict()
+        state_dict['weight'] = block_diagonal._to_blocks(state_dict['weight'])
+        block_diagonal.load_state_dict(state_dict)
+
+        return block_diagonal.to(linear.weight)
+
+    def _to_blocks(self, weight: torch.Tensor):
+        """
+        Extract diagonal blocks of shape (n_blocks, out_features // n_blocks,
+        in_features // n_blocks) from dense weight of shape (out_features,
+        in_features).
+        """
+        block_out = self.out_features // self.n_blocks
+        block_in = self.in_features // self.n_blocks
+
+        return torch.stack([
+            weight[b * block_out:(b + 1) * block_out,
+                   b * block_in:(b + 1) * block_in]
+            for b in range(self.n_blocks)
+        ])
+
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        """
+        Accept weights stored in dense `nn.Linear` layout, discarding
+        cross-block weights.
+        """
+        key = prefix + 'weight'
+        if key in state_dict and state_dict[key].ndim == 2:
+            warnings.warn('Warning: loading dense linear weights into '
+                          'block-diagonal layer; cross-block weights are '
+                          'discarded')
+            state_dict[key] = self._to_blocks(state_dict[key])
+
+        super()._load_from_state_dict(state_dict, prefix, *args, **kwargs)
+
+    def forward(self, x: torch.Tensor):
+        """
+        Parameters
+        ----------
+        x (Tensor): shape (..., in_features)
+
+        Returns
+        -------
+        out (Tensor): shape (..., out_features)
+        """
+        out = torch.einsum(
+            '...bi,boi->...bo',
+            x.reshape(*x.shape[:-1], self.n_blocks, -1),
+            self.weight
+        ).flatten(-2)
+
+        if self.bias is not None:
+            out = out + self.bias
+
+        return out
+
+    def extra_repr(self):
+        return (f'in_features={self.in_features}, '
+                f'out_features={self.out_features}, '
+                f'n_blocks={self.n_blocks}, bias={self.bias is not None}')
@@ -0,0 +1,224 @@
+import math
+import re
+
+import torch
+import torch.nn as nn
+
+from typing import Tuple
+
+################################################################################
+# LSTM built from linear layers for DEMUCS bottleneck
+################################################################################
+
+
+def _lstm_cell(gates: torch.Tensor,
+               c: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    Apply LSTM gate nonlinearities and state updates given summed input and
+    hidden-state projections of shape (n_batch, 4 * hidden_size).
+    """
+    i, f, g, o = gates.chunk(4, dim=-1)
+    c = torch.sigmoid(f) * c + torch.sigmoid(i) * torch.tanh(g)
+    h = torch.sigmoid(o) * torch.tanh(c)
+    return h, c
+
+
+_scripted_lstm_cell = None
+
+
+def _get_lstm_cell():
+    """
+    Return LSTM cell scripted so that the elementwise operations are fused
+    into a single kernel. Scripting is deferred until first use rather than
+    performed on import, as `torch.jit.script` is deprecated and emits a
+    warning in recent PyTorch versions.
+    """
+    global _scripted_lstm_cell
+    if _scripted_lstm_cell is None:
+        _scripted_lstm_cell = torch.jit.script(_lstm_cell)
+    return _scripted_lstm_cell
+
+
+class LinearLSTM(nn.Module):
+    """
+    Multi-layer batch-first LSTM whose input and hidden-state gate projections
+    are `nn.Linear` modules, matching the interface of `nn.LSTM`. Expressing
+    the gate projections as linear layers allows them to be converted by tools
+    that operate on `nn.Linear` modules (e.g. for low-precision training) and
+    traced by `torch.compile` alongside surrounding operations, at the cost of
+    a Python-level loop over time steps. Gate nonlinearities are computed by a
+    scripted, fused cell. State dicts use `nn.LSTM` parameter names, so that
+    weights can be exchanged freely between the two modules.
+    """
+    def __init__(self,
+                 input_size: int,
+                 hidden_size: int,
+                 num_layers: int = 1,
+                 bias: bool = True,
+                 bidirectional: bool = False):
+        """
+        :param input_size: input feature dimension
+        :param hidden_size: hidden state dimension
+        :param num_layers: number of stacked recurrent layers
+        :param bias: if True, use bias in gate projections
+        :param bidirectional: if True, use bidirectional layers
+        """
+        super().__init__()
+
+        self.input_size = input_size
+        self.hidden_size = hidden_size
+        self.num_layers = num_layers
+        self.bias = bias
+        self.bidirectional = bidirectional
+        self.num_directions = 2 if bidirectional else 1
+
+        # gate projections, indexed by `layer * num_directions + direction`
+        self.input_proj = nn.ModuleList()
+        self.hidden_proj = nn.ModuleList()
+
+        for layer in range(num_layers):
+            for direction in range(self.num_directions):
+
+                layer_input_size = input_size if not layer \
+                    else hidden_size * self.num_directions
+
+                self.input_proj.append(
+                    nn.Linear(layer_input_size, 4 * hidden_size, bias=bias)
+                )
+                self.hidden_proj.append(
+                    nn.Linear(hidden_size, 4 * hidden_size, bias=bias)
+                )
+
+        self.reset_parameters()
+
+        # save weights under `nn.LSTM` parameter names
+        self._register_state_dict_hook(LinearLSTM._state_dict_hook)
+
+        # script fused cell on construction, outside of any compiled region
+        _get_lstm_cell()
+
+    def reset_parameters(self):
+        """Match initialization of `nn.LSTM`"""
+        bound = 1 / math.sqrt(self.hidden_size)
+        for p in self.parameters():
+            nn.init.uniform_(p, -bound, bound)
+
+    @classmethod
+    def from_lstm(cls, lstm: nn.LSTM):
+        """Construct from a (trained) batch-first `nn.LSTM`."""
+        assert lstm.batch_first and not lstm.proj_size, \
+            'Only batch-first LSTM layers without projections are supported'
+
+        linear_lstm = cls(
+            lstm.input_size,
+            lstm.hidden_size,
+            num_layers=lstm.num_layers,
+            bias=lstm.bias,
+            bidirectional=lstm.bidirectional
+        )
+        linear_lstm.load_state_dict(lstm.state_dict())
+
+        return linear_lstm.to(lstm.weight_ih_l0)
+
+    @staticmethod
+    def _state_dict_hook(module, state_dict, prefix, local_metadata):
+        """
+        Rename gate projection weights to `nn.LSTM` format, e.g. `weight_ih_l0`
+        and `bias_hh_l1_reverse`, in `nn.LSTM` order. Entries that do not
+        correspond to an `nn.LSTM` parameter (e.g. packed parameters of
+        dynamically-quantized projections) are left unchanged.
+        """
+        for layer in range(module.num_layers):
+            for direction in range(module.num_directions):
+
+                idx = layer * module.num_directions + direction
+                suffix = f'_l{layer}' + ('_reverse' if direction else '')
+
+                for param in ['weight', 'bias']:
+                    for proj, name in [('ih', 'input_proj'),
+                                       ('hh', 'hidden_proj')]:
+                        key = f'{prefix}{name}.{idx}.{param}'
+                        if key in state_dict:
+                            state_dict[f'{prefix}{param}_{proj}{suffix}'] = \
+                                state_dict.pop(key)
+
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        """
+        Accept weights stored in `nn.LSTM` format, e.g. `weight_ih_l0` and
+        `bias_hh_l1_reverse`, as well as in per-projection format, e.g.
+        `input_proj.0.weight`.
+        """
+        pattern = re.compile(
+            re.escape(prefix) + r'(weight|bias)_(ih|hh)_l(\d+)(_reverse)?$'
+        )
+
+        for key in list(state_dict.keys()):
+            match = pattern.match(key)
+            if match is None:
+                continue
+
+            param, proj, layer, reverse = match.groups()
+            idx = int(layer) * self.num_directions + int(reverse is not None)
+            proj = 'input_proj' if proj == 'ih' else 'hidden_proj'
+
+            state_dict[f'{prefix}{proj}.{idx}.{param}'] = state_dict.pop(key)
+
+        super()._load_from_state_dict(state_dict, prefix, *args, **kwargs)
+
+    def forward(self,
+                x: torch.Tensor,
+                hx: Tuple[torch.Tensor, torch.Tensor] = None):
+        """
+        Parameters
+        ----------
+        x (Tensor):  shape (n_batch, n_frames, input_size)
+        hx (tuple):  optional initial hidden and cell states, each of shape
+                     (num_layers * num_directions, n_batch, hidden_size)
+
+        Returns
+        -------
+        out (Tensor): shape (n_batch, n_frames, num_directions * hidden_size)
+        hx (tuple):   final hidden and cell states, each of shape
+                      (num_layers * num_directions, n_batch, hidden_size)
+        """
+        n_batch, n_frames, _ = x.shape
+
+        if hx is None:
+            zeros = x.new_zeros(
+                self.num_layers * self.num_directions,
+                n_batch,
+                self.hidden_size
+            )
+            hx = (zeros, zeros)
+
+        h_n, c_n = [], []
+        cell = _get_lstm_cell()
+
+        for layer in range(self.num_layers):
+
+            outputs = []
+            for direction in range(self.num_directions):
+
+                idx = layer * self.num_directions + direction
+                h, c = hx[0][idx], hx[1][idx]
+
+                # compute input projections for all time steps at once
+                gates_x = self.input_proj[idx](x)
+
+                steps = range(n_frames) if not direction \
+                    else range(n_frames - 1, -1, -1)
+
+                out = [None] * n_frames
+                for t in steps:
+                    h, c = cell(
+                        gates_x[:, t] + self.hidden_proj[idx](h), c
+                    )
+                    out[t] = h
+
+                outputs.append(torch.stack(out, dim=1))
+                h_n.append(h)
+                c_n.append(c)
+
+            x = torch.cat(outputs, dim=-1)
+
+        return x, (torch.stack(h_n), torch.stack(c_n))
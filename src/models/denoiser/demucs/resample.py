@@ -31,12 +31,15 @@ def kernel_upsample2(zeros=56):
     return kernel
 
 
-def upsample2(x, zeros=56):
+def upsample2(x, zeros=56, kernel=None):
     """
-    Upsample input by a factor of 2 using sinc interpolation.
+    Upsample input by a factor of 2 using sinc interpolation. Optionally, pass
+    a precomputed kernel (see `kernel_upsample2`) to avoid recomputing it.
     """
     *other, time = x.shape
-    kernel = kernel_upsample2(zeros).to(x)
+    if kernel is None:
+        kernel = kernel_upsample2(zeros)
+    kernel = kernel.to(x)
     out = F.conv1d(
         x.view(-1, 1, time),
         kernel,
@@ -58,16 +61,20 @@ def kernel_downsample2(zeros=56):
     return kernel
 
 
-def downsample2(x, zeros=56):
+def downsample2(x, zeros=56, kernel=None):
     """
-    Downsample input by a factor of 2 using sinc interpolation.
+    Downsample input by a factor of 2 using sinc interpolation. Optionally,
+    pass a precomputed kernel (see `kernel_downsample2`) to avoid recomputing
+    it.
     """
     if x.shape[-1] % 2 != 0:
         x = F.pad(x, (0, 1))
     x_even = x[..., ::2]
     x_odd = x[..., 1::2]
     *other, time = x_odd.shape
-    kernel = kernel_downsample2(zeros).to(x)
+    if kernel is None:
+        kernel = kernel_downsample2(zeros)
+    kernel = kernel.to(x)
     out = x_even + F.conv1d(
         x_odd.view(-1, 1, time),
         kernel,